@@ -4,8 +4,8 @@
 # Licensed under the MIT License.
 
 import logging
-import math
-from typing import List
+from typing import Dict, List, Optional
+from uuid import UUID
 
 from onefuzztypes.enums import NodeState, ScalesetState
 from onefuzztypes.models import AutoScaleConfig, TaskPool
@@ -13,6 +13,24 @@ from onefuzztypes.models import AutoScaleConfig, TaskPool
 from .pools import Node, Pool, Scaleset
 from .tasks.main import Task
 
+# state sets are constant; build them once so the per-scaleset membership
+# checks are O(1) set lookups rather than rebuilt lists
+_SCALE_UP_STATES = frozenset([ScalesetState.running, ScalesetState.resize])
+_MODIFYING_STATES = frozenset(ScalesetState.modifying())
+_SCALE_DOWN_SKIP_STATES = frozenset(
+    [ScalesetState.resize, ScalesetState.shutdown, ScalesetState.halt]
+)
+
+
+def _nodes_by_scaleset(scalesets: List[Scaleset]) -> Dict[UUID, List[Node]]:
+    """ fetch every node in the given scalesets with a single query """
+    result: Dict[UUID, List[Node]] = {x.scaleset_id: [] for x in scalesets}
+    if result:
+        for node in Node.search(query={"scaleset_id": list(result)}):
+            if node.scaleset_id in result:
+                result[node.scaleset_id].append(node)
+    return result
+
 
 def scale_up(pool: Pool, scalesets: List[Scaleset], nodes_needed: int) -> None:
     logging.info("Scaling up")
@@ -20,8 +38,15 @@ def scale_up(pool: Pool, scalesets: List[Scaleset], nodes_needed: int) -> None:
     if not isinstance(autoscale_config, AutoScaleConfig):
         return
 
+    # saves are collected and committed with batch transactions rather
+    # than one round trip per scaleset
+    to_save: List[Scaleset] = []
+
     for scaleset in scalesets:
-        if scaleset.state in [ScalesetState.running, ScalesetState.resize]:
+        if nodes_needed == 0:
+            break
+
+        if scaleset.state in _SCALE_UP_STATES:
 
             max_size = min(scaleset.max_size(), autoscale_config.scaleset_size)
             logging.info(
@@ -39,29 +64,16 @@ def scale_up(pool: Pool, scalesets: List[Scaleset], nodes_needed: int) -> None:
                     scaleset.size = max_size
                     nodes_needed = nodes_needed - (max_size - current_size)
                 scaleset.state = ScalesetState.resize
-                scaleset.save()
-
-            else:
-                continue
-
-            if nodes_needed == 0:
-                return
-
-    for _ in range(
-        math.ceil(
-            nodes_needed
-            / min(
-                Scaleset.scaleset_max_size(autoscale_config.image),
-                autoscale_config.scaleset_size,
-            )
-        )
-    ):
+                to_save.append(scaleset)
+
+    new_scaleset_cap = min(
+        Scaleset.scaleset_max_size(autoscale_config.image),
+        autoscale_config.scaleset_size,
+    )
+    # ceiling division, without converting through float
+    for _ in range(-(-nodes_needed // new_scaleset_cap)):
         logging.info("Creating Scaleset for Pool %s", pool.name)
-        max_nodes_scaleset = min(
-            Scaleset.scaleset_max_size(autoscale_config.image),
-            autoscale_config.scaleset_size,
-            nodes_needed,
-        )
+        max_nodes_scaleset = min(new_scaleset_cap, nodes_needed)
 
         if not autoscale_config.region:
             raise Exception("Region is missing")
@@ -75,29 +87,37 @@ def scale_up(pool: Pool, scalesets: List[Scaleset], nodes_needed: int) -> None:
             spot_instances=autoscale_config.spot_instances,
             tags={"pool": pool.name},
         )
-        scaleset.save()
+        to_save.append(scaleset)
         nodes_needed -= max_nodes_scaleset
 
+    Scaleset.save_batch(to_save)
+
 
-def scale_down(scalesets: List[Scaleset], nodes_to_remove: int) -> None:
+def scale_down(
+    scalesets: List[Scaleset],
+    nodes_to_remove: int,
+    nodes_by_scaleset: Optional[Dict[UUID, List[Node]]] = None,
+) -> None:
     logging.info("Scaling down")
+    if nodes_by_scaleset is None:
+        nodes_by_scaleset = _nodes_by_scaleset(scalesets)
+
+    # each scaleset is saved at most once, after its final state is known
+    to_save: Dict[UUID, Scaleset] = {}
+
     for scaleset in scalesets:
-        num_of_nodes = len(Node.search_states(scaleset_id=scaleset.scaleset_id))
-        if scaleset.size != num_of_nodes and scaleset.state not in [
-            ScalesetState.resize,
-            ScalesetState.shutdown,
-            ScalesetState.halt,
-        ]:
+        scaleset_nodes = nodes_by_scaleset.get(scaleset.scaleset_id, [])
+        num_of_nodes = len(scaleset_nodes)
+        if (
+            scaleset.size != num_of_nodes
+            and scaleset.state not in _SCALE_DOWN_SKIP_STATES
+        ):
             scaleset.state = ScalesetState.resize
-            scaleset.save()
+            to_save[scaleset.scaleset_id] = scaleset
 
-        free_nodes = Node.search_states(
-            scaleset_id=scaleset.scaleset_id,
-            states=[NodeState.free],
-        )
         nodes = []
-        for node in free_nodes:
-            if not node.delete_requested:
+        for node in scaleset_nodes:
+            if node.state == NodeState.free and not node.delete_requested:
                 nodes.append(node)
         logging.info("Scaleset: %s, #Free Nodes: %s", scaleset.scaleset_id, len(nodes))
 
@@ -107,7 +127,7 @@ def scale_down(scalesets: List[Scaleset], nodes_to_remove: int) -> None:
             if max_nodes_remove >= scaleset.size and len(nodes) >= scaleset.size:
                 scaleset.state = ScalesetState.shutdown
                 nodes_to_remove = nodes_to_remove - scaleset.size
-                scaleset.save()
+                to_save[scaleset.scaleset_id] = scaleset
                 for node in nodes:
                     node.set_shutdown()
                 continue
@@ -116,30 +136,31 @@ def scale_down(scalesets: List[Scaleset], nodes_to_remove: int) -> None:
             scaleset.size = scaleset.size - max_nodes_remove
             nodes_to_remove = nodes_to_remove - max_nodes_remove
             scaleset.state = ScalesetState.resize
-            scaleset.save()
-
+            to_save[scaleset.scaleset_id] = scaleset
 
-def get_vm_count(tasks: List[Task]) -> int:
-    count = 0
-    for task in tasks:
-        task_pool = task.get_pool()
-        if (
-            not task_pool
-            or not isinstance(task_pool, Pool)
-            or not isinstance(task.config.pool, TaskPool)
-        ):
-            continue
-        count += task.config.pool.count
-    return count
+    Scaleset.save_batch(list(to_save.values()))
 
 
-def autoscale_pool(pool: Pool) -> None:
+def get_vm_count(tasks: List[Task]) -> int:
+    return sum(
+        task.config.pool.count
+        for task in tasks
+        if isinstance(task.config.pool, TaskPool) and isinstance(task.get_pool(), Pool)
+    )
+
+
+def autoscale_pool(
+    pool: Pool,
+    tasks: Optional[List[Task]] = None,
+    scalesets: Optional[List[Scaleset]] = None,
+) -> None:
     logging.info("autoscale: %s", pool.autoscale)
     if not pool.autoscale:
         return
 
     # get all the tasks (count not stopped) for the pool
-    tasks = Task.get_tasks_by_pool_name(pool.name)
+    if tasks is None:
+        tasks = Task.get_tasks_by_pool_name(pool.name)
     logging.info("Pool: %s, #Tasks %d", pool.name, len(tasks))
 
     num_of_tasks = get_vm_count(tasks)
@@ -149,10 +170,11 @@ def autoscale_pool(pool: Pool) -> None:
 
     # do scaleset logic match with pool
     # get all the scalesets for the pool
-    scalesets = Scaleset.search_by_pool(pool.name)
+    if scalesets is None:
+        scalesets = Scaleset.search_by_pool(pool.name)
     pool_resize = False
     for scaleset in scalesets:
-        if scaleset.state in ScalesetState.modifying():
+        if scaleset.state in _MODIFYING_STATES:
             pool_resize = True
             break
         nodes_needed = nodes_needed - scaleset.size
@@ -161,14 +183,15 @@ def autoscale_pool(pool: Pool) -> None:
         return
 
     logging.info("Pool: %s, #Nodes Needed: %d", pool.name, nodes_needed)
+    nodes_by_scaleset: Dict[UUID, List[Node]] = {}
     if nodes_needed > 0:
         # resizing scaleset or creating new scaleset.
         scale_up(pool, scalesets, nodes_needed)
     elif nodes_needed < 0:
-        for scaleset in scalesets:
-            nodes = Node.search_states(scaleset_id=scaleset.scaleset_id)
+        nodes_by_scaleset = _nodes_by_scaleset(scalesets)
+        for nodes in nodes_by_scaleset.values():
             for node in nodes:
                 if node.delete_requested:
                     nodes_needed += 1
     if nodes_needed < 0:
-        scale_down(scalesets, abs(nodes_needed))
+        scale_down(scalesets, abs(nodes_needed), nodes_by_scaleset)
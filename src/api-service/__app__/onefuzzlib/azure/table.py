@@ -5,13 +5,17 @@
 
 import logging
 import os
-from typing import Optional
+from typing import Optional, Set
 
 from azure.cosmosdb.table import TableService
 from memoization import cached
 
 from .creds import get_storage_account_name_key
 
+# tables already verified to exist, so the check is a one-time cost per
+# table rather than a round trip on every client cache refresh
+_checked_tables: Set[str] = set()
+
 
 @cached(ttl=60)
 def get_client(
@@ -24,7 +28,11 @@ def get_client(
     name, key = get_storage_account_name_key(account_id)
     client = TableService(account_name=name, account_key=key)
 
-    if table and not client.exists(table):
-        logging.info("creating missing table %s", table)
-        client.create_table(table, fail_on_exist=False)
+    if table:
+        entry = "%s/%s" % (account_id, table)
+        if entry not in _checked_tables:
+            if not client.exists(table):
+                logging.info("creating missing table %s", table)
+                client.create_table(table, fail_on_exist=False)
+            _checked_tables.add(entry)
     return client
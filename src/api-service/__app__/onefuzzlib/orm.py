@@ -7,10 +7,12 @@ import inspect
 import json
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
 from typing import (
     Any,
     Callable,
     Dict,
+    FrozenSet,
     List,
     Mapping,
     Optional,
@@ -22,6 +24,7 @@ from typing import (
 from uuid import UUID
 
 from azure.common import AzureConflictHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table import TableBatch
 from onefuzztypes.enums import (
     ErrorCode,
     JobState,
@@ -36,6 +39,7 @@ from onefuzztypes.enums import (
 from onefuzztypes.models import Error
 from onefuzztypes.primitives import Container, PoolName, Region
 from pydantic import BaseModel, Field
+from pydantic.fields import ModelField
 from typing_extensions import Protocol
 
 from .azure.table import get_client
@@ -66,6 +70,9 @@ KEY = Union[int, str, UUID, Enum]
 
 HOURS = 60 * 60
 
+# maximum operations in a single table batch transaction
+BATCH_MAX_SIZE = 100
+
 
 class HasState(Protocol):
     # TODO: this should be bound tighter than Any
@@ -97,6 +104,107 @@ def process_state_updates(obj: HasState, max_updates: int = 5) -> None:
             break
 
 
+@lru_cache(maxsize=None)
+def _key_fields(cls: Type["ORMMixin"]) -> Tuple[str, Optional[str]]:
+    """key_fields() always returns the same constant tuple for a given class,
+    but is dispatched on every table operation.  Cache it per class."""
+    return cls.key_fields()
+
+
+@lru_cache(maxsize=None)
+def _update_type(cls: Type["ORMMixin"]) -> Optional[UpdateType]:
+    """the class name to UpdateType mapping is static; look it up once"""
+    return UpdateType.__members__.get(cls.__name__)
+
+
+@lru_cache(maxsize=None)
+def _datetime_fields(cls: Type[BaseModel]) -> FrozenSet[str]:
+    """fields stored as native EDM.DateTime, keyed by their save alias.
+
+    Precomputed per class so save() never scans __fields__ per entity.
+    """
+    return frozenset(
+        field.alias for field in cls.__fields__.values() if field.type_ == datetime
+    )
+
+
+@lru_cache(maxsize=None)
+def _has_state(cls: Type["ORMMixin"]) -> bool:
+    """whether a class carries a state field is a property of the class,
+    not the instance; introspect once instead of probing per call"""
+    return "state" in cls.__fields__
+
+
+@lru_cache(maxsize=None)
+def _cached_parser(cls: Type[A]) -> Callable[[Dict[str, Any]], A]:
+    """reuse the bound parse_obj for each class, skipping the descriptor
+    lookup and classmethod dispatch for every row a search returns"""
+    return cls.parse_obj
+
+
+# types the table service hands back already materialized, which can skip
+# per-field validation entirely on the trusted load path
+_PASSTHROUGH_TYPES = (str, int, float, bool, datetime)
+
+
+@lru_cache(maxsize=None)
+def _trusted_fields(
+    cls: Type[BaseModel],
+) -> Optional[Tuple[Tuple[str, ModelField, Optional[type]], ...]]:
+    """per-field plan for load_trusted: (name, field, passthrough type).
+
+    Returns None for models with root validators, which construct()
+    would silently skip.
+    """
+
+    if cls.__pre_root_validators__ or cls.__post_root_validators__:
+        return None
+
+    plan = []
+    for name, field in cls.__fields__.items():
+        passthrough: Optional[type] = None
+        if (
+            not field.sub_fields
+            and not field.class_validators
+            and field.outer_type_ in _PASSTHROUGH_TYPES
+        ):
+            passthrough = field.outer_type_
+        plan.append((name, field, passthrough))
+    return tuple(plan)
+
+
+@lru_cache(maxsize=None)
+def _json_loads_fields(cls: Type[BaseModel]) -> Tuple[str, ...]:
+    """fields that are stored as serialized json and need to be parsed on load.
+
+    Inspecting annotations is pure reflection overhead, so do it once per
+    class rather than once per row.
+    """
+
+    fields = []
+    for name, parameter in inspect.signature(cls).parameters.items():
+        annotation = parameter.annotation
+
+        if inspect.isclass(annotation):
+            if issubclass(annotation, BaseModel) or issubclass(annotation, dict):
+                fields.append(name)
+            continue
+
+        if getattr(annotation, "__origin__", None) == Union and any(
+            inspect.isclass(x) and issubclass(x, BaseModel)
+            for x in annotation.__args__
+        ):
+            fields.append(name)
+            continue
+
+        # Required for Python >=3.7. In 3.6, a `Dict[_,_]` annotation is a class
+        # according to `inspect.isclass`.
+        if getattr(annotation, "__origin__", None) == dict:
+            fields.append(name)
+
+    return tuple(fields)
+
+
 def resolve(key: KEY) -> str:
     if isinstance(key, str):
         return key
@@ -115,7 +223,7 @@ def build_filters(
     if not query_args:
         return (None, {})
 
-    partition_key_field, row_key_field = cls.key_fields()
+    partition_key_field, row_key_field = _key_fields(cls)
 
     search_filter_parts = []
     post_filters: QueryFilter = {}
@@ -135,28 +243,43 @@ def build_filters(
             field_name = field
 
         parts: Optional[List[str]] = None
+        clause: Optional[str] = None
+        # the all-string branches join the values with a single separator
+        # rather than formatting a clause per value
+        separator = f"' or {field_name} eq '"
         if isinstance(values[0], int):
             parts = []
             for x in values:
                 if not isinstance(x, int):
                     raise TypeError("unexpected type")
-                parts.append("%s eq %d" % (field_name, x))
+                parts.append(f"{field_name} eq {x:d}")
         elif isinstance(values[0], Enum):
             parts = []
             for x in values:
                 if not isinstance(x, Enum):
                     raise TypeError("unexpected type")
-                parts.append("%s eq '%s'" % (field_name, x.name))
+                parts.append(f"{field_name} eq '{x.name}'")
         elif all(isinstance(x, SAFE_STRINGS) for x in values):
-            parts = ["%s eq '%s'" % (field_name, x) for x in values]
+            joined = separator.join(str(x) for x in values)
+            clause = f"{field_name} eq '{joined}'"
+        elif all(isinstance(x, str) for x in values):
+            # plain strings are pushed into the server-side filter, with
+            # single quotes doubled per OData escaping
+            joined = separator.join(x.replace("'", "''") for x in values)
+            clause = f"{field_name} eq '{joined}'"
         else:
             post_filters[field_name] = values
 
         if parts:
             if len(parts) == 1:
-                search_filter_parts.append(parts[0])
+                clause = parts[0]
             else:
-                search_filter_parts.append("(" + " or ".join(parts) + ")")
+                clause = "(" + " or ".join(parts) + ")"
+        elif clause and len(values) > 1:
+            clause = f"({clause})"
+
+        if clause:
+            search_filter_parts.append(clause)
 
     if search_filter_parts:
         return (" and ".join(search_filter_parts), post_filters)
@@ -181,6 +304,25 @@ MappingIntStrAny = Mapping[Union[int, str], Any]
 # A = TypeVar("A", bound="Model")
 
 
+def _to_primitive(value: Any) -> Any:
+    """resolve wrapped types (UUID, Enum, datetime) the same way .json() would,
+    without serializing to a string and parsing it back"""
+    if isinstance(value, dict):
+        return {
+            key if isinstance(key, str) else str(key): _to_primitive(entry)
+            for key, entry in value.items()
+        }
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_to_primitive(entry) for entry in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return _to_primitive(value.value)
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
 class ModelMixin(BaseModel):
     def export_exclude(self) -> Optional[MappingIntStrAny]:
         return None
@@ -193,9 +335,8 @@ class ModelMixin(BaseModel):
         exclude: MappingIntStrAny = None,
         include: MappingIntStrAny = None,
     ) -> Dict[str, Any]:
-        # cycling through json means all wrapped types get resolved, such as UUID
-        result: Dict[str, Any] = json.loads(
-            self.json(
+        result: Dict[str, Any] = _to_primitive(
+            self.dict(
                 by_alias=by_alias,
                 exclude_none=exclude_none,
                 exclude=exclude,
@@ -252,10 +393,18 @@ class ORMMixin(ModelMixin):
         return {}
 
     def event(self) -> Any:
-        return self.raw(exclude_none=True, include=self.event_include())
+        include = self.event_include()
+        # an empty include set can only produce an empty dict; skip walking
+        # the model entirely.  None means "include everything".
+        if include is not None and not include:
+            return None
+        return self.raw(exclude_none=True, include=include)
 
     def telemetry(self) -> Any:
-        return self.raw(exclude_none=True, include=self.telemetry_include())
+        include = self.telemetry_include()
+        if include is not None and not include:
+            return None
+        return self.raw(exclude_none=True, include=include)
 
     def _event_as_needed(self) -> None:
         # Upon ORM save, if the object returns event data, we'll send it to the
@@ -265,8 +414,15 @@ class ORMMixin(ModelMixin):
             return
         add_event(self.table_name(), data)
 
+    def _telemetry_as_needed(self) -> None:
+        if self.table_name() not in TelemetryEvent.__members__:
+            return
+        telem = self.telemetry()
+        if telem:
+            track_event_filtered(TelemetryEvent[self.table_name()], telem)
+
     def get_keys(self) -> Tuple[KEY, KEY]:
-        partition_key_field, row_key_field = self.key_fields()
+        partition_key_field, row_key_field = _key_fields(type(self))
 
         partition_key = getattr(self, partition_key_field)
         if row_key_field:
@@ -276,37 +432,40 @@ class ORMMixin(ModelMixin):
 
         return (partition_key, row_key)
 
-    def save(self, new: bool = False, require_etag: bool = False) -> Optional[Error]:
-        # TODO: migrate to an inspect.signature() model
-        raw = self.raw(by_alias=True, exclude_none=True, exclude=self.save_exclude())
-        for key in raw:
-            if not isinstance(raw[key], (str, int)):
-                raw[key] = json.dumps(raw[key])
-
-        # for datetime fields that passed through filtering, use the real value,
-        # rather than a serialized form
-        for field in self.__fields__:
-            if field not in raw:
+    def _save_payload(self) -> Dict[str, Any]:
+        raw = self.dict(by_alias=True, exclude_none=True, exclude=self.save_exclude())
+        partition_key_field, row_key_field = _key_fields(type(self))
+        datetime_fields = _datetime_fields(type(self))
+
+        # a single pass builds the payload: datetimes stay native (stored
+        # as EDM.DateTime), nested structures are stored as serialized
+        # json, wrapped types (UUID, Enum) become strings, the key fields
+        # are emitted as PartitionKey/RowKey (which must be 'str'), and
+        # the server-managed Timestamp is dropped
+        payload: Dict[str, Any] = {}
+        for key, value in raw.items():
+            if key == "Timestamp":
                 continue
-            if self.__fields__[field].type_ == datetime:
-                raw[field] = getattr(self, field)
-
-        partition_key_field, row_key_field = self.key_fields()
+            if key not in datetime_fields and not isinstance(value, (str, int)):
+                value = _to_primitive(value)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+            if key == partition_key_field:
+                payload["PartitionKey"] = resolve(value)
+            elif key == row_key_field:
+                payload["RowKey"] = resolve(value)
+            else:
+                payload[key] = value
 
-        # PartitionKey and RowKey must be 'str'
-        raw["PartitionKey"] = resolve(raw[partition_key_field])
-        raw["RowKey"] = resolve(raw[row_key_field or partition_key_field])
+        if row_key_field is None:
+            payload["RowKey"] = payload["PartitionKey"]
 
-        del raw[partition_key_field]
-        if row_key_field in raw:
-            del raw[row_key_field]
+        return payload
 
+    def save(self, new: bool = False, require_etag: bool = False) -> Optional[Error]:
+        raw = self._save_payload()
         client = get_client(table=self.table_name())
 
-        # never save the timestamp
-        if "Timestamp" in raw:
-            del raw["Timestamp"]
-
         if new:
             try:
                 self.etag = client.insert_entity(self.table_name(), raw)
@@ -319,14 +478,44 @@ class ORMMixin(ModelMixin):
         else:
             self.etag = client.insert_or_replace_entity(self.table_name(), raw)
 
-        if self.table_name() in TelemetryEvent.__members__:
-            telem = self.telemetry()
-            if telem:
-                track_event_filtered(TelemetryEvent[self.table_name()], telem)
-
+        self._telemetry_as_needed()
         self._event_as_needed()
         return None
 
+    @classmethod
+    def save_batch(cls: Type[A], entities: List[A]) -> None:
+        """insert-or-replace multiple entities with batch transactions.
+
+        Batch transactions require a shared PartitionKey and accept at most
+        100 operations, so the entities are grouped accordingly.  Cuts N
+        save round trips down to ceil(N/100) per partition.
+        """
+
+        if not entities:
+            return
+
+        client = get_client(table=cls.table_name())
+
+        by_partition: Dict[str, List[Tuple[A, Dict[str, Any]]]] = {}
+        for entity in entities:
+            raw = entity._save_payload()
+            by_partition.setdefault(raw["PartitionKey"], []).append((entity, raw))
+
+        for group in by_partition.values():
+            for offset in range(0, len(group), BATCH_MAX_SIZE):
+                chunk = group[offset : offset + BATCH_MAX_SIZE]
+                batch = TableBatch()
+                for _, raw in chunk:
+                    batch.insert_or_replace_entity(raw)
+                etags = client.commit_batch(cls.table_name(), batch)
+                for (entity, _), etag in zip(chunk, etags):
+                    if isinstance(etag, str):
+                        entity.etag = etag
+
+        for entity in entities:
+            entity._telemetry_as_needed()
+            entity._event_as_needed()
+
     def delete(self) -> None:
         # fire off an event so Signalr knows it's being deleted
         self._event_as_needed()
@@ -343,8 +532,10 @@ class ORMMixin(ModelMixin):
             pass
 
     @classmethod
-    def load(cls: Type[A], data: Dict[str, Union[str, bytes, bytearray]]) -> A:
-        partition_key_field, row_key_field = cls.key_fields()
+    def _row_to_fields(
+        cls: Type[A], data: Dict[str, Union[str, bytes, bytearray]]
+    ) -> Dict[str, Any]:
+        partition_key_field, row_key_field = _key_fields(cls)
 
         if partition_key_field in data:
             raise Exception(
@@ -363,31 +554,51 @@ class ORMMixin(ModelMixin):
         del data["PartitionKey"]
         del data["RowKey"]
 
-        for key in inspect.signature(cls).parameters:
-            if key not in data:
-                continue
+        for key in _json_loads_fields(cls):
+            if key in data:
+                data[key] = json.loads(data[key])
 
-            annotation = inspect.signature(cls).parameters[key].annotation
+        return data
 
-            if inspect.isclass(annotation):
-                if issubclass(annotation, BaseModel) or issubclass(annotation, dict):
-                    data[key] = json.loads(data[key])
-                    continue
+    @classmethod
+    def load(cls: Type[A], data: Dict[str, Union[str, bytes, bytearray]]) -> A:
+        return _cached_parser(cls)(cls._row_to_fields(data))
 
-            if getattr(annotation, "__origin__", None) == Union and any(
-                inspect.isclass(x) and issubclass(x, BaseModel)
-                for x in annotation.__args__
-            ):
-                data[key] = json.loads(data[key])
+    @classmethod
+    def load_trusted(cls: Type[A], data: Dict[str, Union[str, bytes, bytearray]]) -> A:
+        """load a row from our own tables without full model validation.
+
+        Rows written by save() were validated on the way in, so re-running
+        every validator on read is wasted work.  Fields the table cannot
+        hand back fully-typed (UUIDs, enums, nested models) are still
+        coerced individually; anything unexpected falls back to the
+        validating path.
+        """
+
+        fields = cls._row_to_fields(data)
+
+        plan = _trusted_fields(cls)
+        if plan is None:
+            return _cached_parser(cls)(fields)
+
+        values: Dict[str, Any] = {}
+        for name, field, passthrough in plan:
+            if name not in fields:
+                if field.default_factory is not None:
+                    # construct() only fills in static defaults
+                    values[name] = field.default_factory()
                 continue
 
-            # Required for Python >=3.7. In 3.6, a `Dict[_,_]` annotation is a class
-            # according to `inspect.isclass`.
-            if getattr(annotation, "__origin__", None) == dict:
-                data[key] = json.loads(data[key])
-                continue
+            value = fields[name]
+            if passthrough is not None and isinstance(value, passthrough):
+                values[name] = value
+            else:
+                value, error = field.validate(value, values, loc=name, cls=cls)
+                if error:
+                    return _cached_parser(cls)(fields)
+                values[name] = value
 
-        return cls.parse_obj(data)
+        return cls.construct(**values)
 
     @classmethod
     def search(
@@ -403,18 +614,29 @@ class ORMMixin(ModelMixin):
             if search_filter is None:
                 search_filter = raw_unchecked_filter
             else:
-                search_filter = "(%s) and (%s)" % (search_filter, raw_unchecked_filter)
+                search_filter = f"({search_filter}) and ({raw_unchecked_filter})"
 
         client = get_client(table=cls.table_name())
-        entries = []
-        for row in client.query_entities(
-            cls.table_name(), filter=search_filter, num_results=num_results
-        ):
+        entries: List[A] = []
+
+        if not post_filters:
+            # everything is filtered server-side, so the result count can be
+            # capped by the service and rows loaded without further checks
+            for row in client.query_entities(
+                cls.table_name(), filter=search_filter, num_results=num_results
+            ):
+                entries.append(cls.load_trusted(row))
+            return entries
+
+        # when rows are filtered client-side, a server-side cap would
+        # undercount; request everything and stop once enough rows matched
+        for row in client.query_entities(cls.table_name(), filter=search_filter):
             if not post_filter(row, post_filters):
                 continue
 
-            entry = cls.load(row)
-            entries.append(entry)
+            entries.append(cls.load_trusted(row))
+            if num_results is not None and len(entries) == num_results:
+                break
         return entries
 
     def queue(
@@ -423,10 +645,10 @@ class ORMMixin(ModelMixin):
         method: Optional[Callable] = None,
         visibility_timeout: Optional[int] = None,
     ) -> None:
-        if not hasattr(self, "state"):
+        if not _has_state(type(self)):
             raise NotImplementedError("Queued an ORM mapping without State")
 
-        update_type = UpdateType.__members__.get(type(self).__name__)
+        update_type = _update_type(type(self))
         if update_type is None:
             raise NotImplementedError("unsupported update type: %s" % self)
 
@@ -4,14 +4,17 @@
 # Licensed under the MIT License.
 
 import logging
+from typing import Dict, List
 
 import azure.functions as func
-from onefuzztypes.enums import NodeState, PoolState
+from onefuzztypes.enums import NodeState, PoolState, TaskState
+from onefuzztypes.primitives import PoolName
 
 from ..onefuzzlib.autoscale import autoscale_pool
 from ..onefuzzlib.dashboard import get_event
 from ..onefuzzlib.orm import process_state_updates
 from ..onefuzzlib.pools import Node, Pool, Scaleset
+from ..onefuzzlib.tasks.main import Task
 
 
 def process_scaleset(scaleset: Scaleset) -> None:
@@ -37,12 +40,34 @@ def main(mytimer: func.TimerRequest, dashboard: func.Out[str]) -> None:  # noqa:
         process_scaleset(scaleset)
 
     pools = Pool.search()
+    autoscale_pools: List[Pool] = []
     for pool in pools:
         if pool.state in PoolState.needs_work():
             logging.info("update pool: %s (%s)", pool.pool_id, pool.name)
             process_state_updates(pool)
         elif pool.state in PoolState.available() and pool.autoscale:
-            autoscale_pool(pool)
+            autoscale_pools.append(pool)
+
+    if autoscale_pools:
+        # batch-load the tasks and scalesets for every autoscaling pool in
+        # a single query each, rather than a round trip per pool
+        pool_names = [x.name for x in autoscale_pools]
+        tasks_by_pool: Dict[PoolName, List[Task]] = {}
+        for task in Task.search_states(states=TaskState.available()):
+            if not task.config.pool:
+                continue
+            tasks_by_pool.setdefault(task.config.pool.pool_name, []).append(task)
+
+        scalesets_by_pool: Dict[PoolName, List[Scaleset]] = {}
+        for scaleset in Scaleset.search(query={"pool_name": pool_names}):
+            scalesets_by_pool.setdefault(scaleset.pool_name, []).append(scaleset)
+
+        for pool in autoscale_pools:
+            autoscale_pool(
+                pool,
+                tasks=tasks_by_pool.get(pool.name, []),
+                scalesets=scalesets_by_pool.get(pool.name, []),
+            )
 
     event = get_event()
     if event:
@@ -37,7 +37,12 @@ class TestQueryBuilder(unittest.TestCase):
             "handle UUID",
         )
         self.assertEqual(
-            build_filters(BasicOrm, {"a": ["a"]}), (None, {"a": ["a"]}), "handle str"
+            build_filters(BasicOrm, {"a": ["a"]}), ("a eq 'a'", {}), "handle str"
+        )
+        self.assertEqual(
+            build_filters(BasicOrm, {"a": ["a'b"]}),
+            ("a eq 'a''b'", {}),
+            "escape quotes in str",
         )
 
         self.assertEqual(
@@ -47,7 +52,7 @@ class TestQueryBuilder(unittest.TestCase):
         )
         self.assertEqual(
             build_filters(BasicOrm, {"a": ["b"], "c": ["d"]}),
-            (None, {"a": ["b"], "c": ["d"]}),
+            ("a eq 'b' and c eq 'd'", {}),
             "multiple fields",
         )
         self.assertEqual(
@@ -65,7 +70,10 @@ class TestQueryBuilder(unittest.TestCase):
                     "c": [UUID("06aa1e71-b025-4325-9983-4b3ce2de12ea")],
                 },
             ),
-            ("b eq 1 and c eq '06aa1e71-b025-4325-9983-4b3ce2de12ea'", {"a": ["b"]}),
+            (
+                "a eq 'b' and b eq 1 and c eq '06aa1e71-b025-4325-9983-4b3ce2de12ea'",
+                {},
+            ),
             "multiple fields, types, and values",
         )
 